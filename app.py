@@ -1,6 +1,8 @@
-from flask import Flask, render_template
+from flask import Flask, render_template, jsonify
 import config
 from extensions import mongo, mail
+from services.drafts import drafts
+from services.scheduler import grading
 
 app = Flask(__name__)
 app.config.from_object(config)
@@ -8,6 +10,8 @@ app.config.from_object(config)
 # Initialize extensions
 mongo.init_app(app)
 mail.init_app(app)
+drafts.init_app(app)
+grading.init_app(app)
 
 # Import blueprints after extensions
 from routes.auth import auth_bp
@@ -20,10 +24,28 @@ from services.feedback_agent import build_feedback_agent
 
 app.feedback_agent = build_feedback_agent()
 
+from commands import register_commands
+
+register_commands(app)
+
+import logging
+import models
+
+# indexes the request paths rely on (copy detection, export, draft expiry)
+with app.app_context():
+    try:
+        models.ensure_indexes()
+    except Exception:
+        logging.getLogger(__name__).exception("Could not create MongoDB indexes")
+
 @app.route("/")
 def home():
     tests = list(mongo.db.tests.find({}, {"_id": 0}))
     return render_template("home.html", tests=tests)
 
+@app.route("/metrics/grading")
+def grading_metrics():
+    return jsonify(grading.metrics())
+
 if __name__ == "__main__":
     app.run(debug=True)
\ No newline at end of file
@@ -0,0 +1,73 @@
+# commands.py
+import json
+import click
+import models
+from services.similarity import find_clusters, backfill_signatures
+from services.export import FORMATS, export_to_file
+from services.compaction import migrate, storage_report
+
+
+def register_commands(app):
+
+    @app.cli.command("similarity-rebuild")
+    @click.option("--test-id", default=None, help="Only backfill responses for this test.")
+    def similarity_rebuild(test_id):
+        """Compute missing MinHash signatures on stored responses."""
+        models.ensure_indexes()
+        updated = backfill_signatures(test_id)
+        click.echo(f"Updated {updated} responses")
+
+    @app.cli.command("similarity-clusters")
+    @click.argument("test_id")
+    @click.option("--question-id", multiple=True, help="Question(s) to check; defaults to all questions in the test.")
+    @click.option("--threshold", type=float, default=None, help="Minimum estimated Jaccard similarity.")
+    def similarity_clusters(test_id, question_id, threshold):
+        """Print candidate copy clusters as JSON lines, one per cluster."""
+        question_ids = question_id
+        if not question_ids:
+            test = models.get_test_by_id(test_id)
+            if not test:
+                raise click.ClickException(f"Test {test_id} not found")
+            question_ids = [q["id"] for q in test.get("questions", [])]
+        for qid in question_ids:
+            for cluster in find_clusters(test_id, qid, threshold=threshold):
+                click.echo(json.dumps({"test_id": test_id, "question_id": qid, **cluster}))
+
+    @app.cli.command("export-results")
+    @click.argument("test_id")
+    @click.argument("output", type=click.Path(dir_okay=False, writable=True))
+    @click.option("--format", "fmt", type=click.Choice(list(FORMATS)), default="csv")
+    @click.option("--no-text", is_flag=True, help="Only export scores, not answers and feedback.")
+    def export_results(test_id, output, fmt, no_text):
+        """Stream one test's results to OUTPUT."""
+        test = models.get_test_by_id(test_id)
+        if not test:
+            raise click.ClickException(f"Test {test_id} not found")
+        models.ensure_indexes()
+        try:
+            written = export_to_file(test, output, fmt, include_text=not no_text)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        click.echo(f"Wrote {written} bytes to {output}")
+
+    @app.cli.command("compact-results")
+    @click.option("--report-only", is_flag=True, help="Only print current storage stats.")
+    def compact_results(report_only):
+        """Migrate results to the compact schema and report storage savings."""
+        if report_only:
+            click.echo(json.dumps(storage_report(), indent=2))
+            return
+        summary = migrate()
+        before, after = summary.pop("before"), summary.pop("after")
+        click.echo(json.dumps(summary, indent=2))
+        for name in ("results", "responses"):
+            b, a = before[name], after[name]
+            click.echo(
+                f"{name}: data {b['size']} -> {a['size']} bytes "
+                f"(saved {b['size'] - a['size']}), "
+                f"avg doc {b['avg_obj_size']} -> {a['avg_obj_size']} bytes, "
+                f"on disk {b['storage_size']} -> {a['storage_size']} bytes"
+            )
+        working_set = sum(before[n]["size"] - after[n]["size"] for n in before)
+        click.echo(f"Working set reduced by {working_set} bytes. "
+                   "On-disk space is returned to the OS after running 'compact' on both collections.")
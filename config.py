@@ -18,3 +18,25 @@ MAIL_USE_TLS = True
 MAIL_USERNAME = os.getenv("MAIL_USERNAME")
 MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
 MAIL_DEFAULT_SENDER = os.getenv("MAIL_DEFAULT_SENDER", MAIL_USERNAME)
+
+# Near-duplicate answer detection (MinHash + LSH)
+SIMILARITY_NUM_PERM = 128
+SIMILARITY_BANDS = 16
+SIMILARITY_THRESHOLD = float(os.getenv("SIMILARITY_THRESHOLD", 0.8))
+
+# Answer drafts: seconds between write-behind flushes of autosaved answers
+DRAFT_FLUSH_INTERVAL = float(os.getenv("DRAFT_FLUSH_INTERVAL", 2))
+
+# Grading scheduler (admission control between page serving and grading)
+GRADING_MAX_JOBS = int(os.getenv("GRADING_MAX_JOBS", 2))
+GRADING_MAX_QUEUE = int(os.getenv("GRADING_MAX_QUEUE", 100))
+GRADING_TORCH_THREADS = int(os.getenv("GRADING_TORCH_THREADS", 0))  # 0 = split cores between jobs
+GRADING_INTERACTIVE_WAIT = float(os.getenv("GRADING_INTERACTIVE_WAIT", 2))
+GRADING_RETRY_AFTER = 30
+
+# Compact result storage: compress answer / feedback text above this size
+COMPRESS_TEXT = os.getenv("COMPRESS_TEXT", "1") != "0"
+COMPRESS_MIN_BYTES = 256
+
+# Instructors allowed to see other students' data (copy detection, exports)
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
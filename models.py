@@ -1,6 +1,14 @@
 # models.py
 from extensions import mongo
+from flask import current_app
+from pymongo import UpdateOne
+from services.similarity import minhash_signature
 import datetime
+import logging
+import uuid
+import zlib
+
+logger = logging.getLogger(__name__)
 
 def users_col():
     return mongo.db.users
@@ -8,6 +16,9 @@ def users_col():
 def tests_col():
     return mongo.db.tests
 
+def drafts_col():
+    return mongo.db.drafts
+
 def responses_col():
     return mongo.db.responses
 
@@ -31,25 +42,156 @@ def add_test(test_obj):
 def get_test_by_id(test_id):
     return tests_col().find_one({"id": test_id}, {"_id": 0})
 
-def store_response(email, test_id, question_id, question_text, student_answer, score):
-    responses_col().insert_one({
+def create_attempt(email, test_id):
+    attempt_id = uuid.uuid4().hex
+    now = datetime.datetime.utcnow()
+    drafts_col().insert_one({
+        "_id": attempt_id,
+        "email": email,
+        "test_id": test_id,
+        "answers": {},
+        "current_q": 0,
+        "created_at": now,
+        "updated_at": now
+    })
+    return attempt_id
+
+def get_attempt(attempt_id):
+    return drafts_col().find_one({"_id": attempt_id})
+
+def find_attempt(email, test_id):
+    return drafts_col().find_one({"email": email, "test_id": test_id}, sort=[("updated_at", -1)])
+
+def save_draft(attempt_id, answers, current_q=None):
+    fields = {f"answers.{qid}": text for qid, text in answers.items()}
+    if current_q is not None:
+        fields["current_q"] = current_q
+    fields["updated_at"] = datetime.datetime.utcnow()
+    drafts_col().update_one({"_id": attempt_id}, {"$set": fields})
+
+def save_drafts(pending):
+    # pending: {attempt_id: {question_id: answer}}
+    now = datetime.datetime.utcnow()
+    ops = []
+    for attempt_id, answers in pending.items():
+        fields = {f"answers.{qid}": text for qid, text in answers.items()}
+        fields["updated_at"] = now
+        ops.append(UpdateOne({"_id": attempt_id}, {"$set": fields}))
+    if ops:
+        drafts_col().bulk_write(ops, ordered=False)
+
+def delete_attempt(attempt_id):
+    drafts_col().delete_one({"_id": attempt_id})
+
+def delete_attempt_submission(attempt_id):
+    # rolls back what a failed grading run stored for an attempt
+    responses_col().delete_many({"attempt_id": attempt_id})
+    results_col().delete_many({"attempt_id": attempt_id})
+
+def pack_text(text):
+    # long answer / feedback text is stored zlib-compressed when enabled
+    if not text or not current_app.config.get("COMPRESS_TEXT", True):
+        return text
+    raw = text.encode("utf-8")
+    if len(raw) < current_app.config.get("COMPRESS_MIN_BYTES", 256):
+        return text
+    packed = zlib.compress(raw, 6)
+    return packed if len(packed) < len(raw) else text
+
+def unpack_text(value):
+    if isinstance(value, bytes):
+        return zlib.decompress(value).decode("utf-8")
+    return value
+
+def store_response(email, test_id, question_id, student_answer, score, clean_answer=None, breakdown=None, feedback=None, attempt_id=None):
+    # question text lives in `tests`; answer and feedback are stored only here
+    doc = {
         "email": email,
         "test_id": test_id,
         "question_id": question_id,
-        "question_text": question_text,
-        "student_answer": student_answer,
+        "student_answer": pack_text(student_answer),
         "score": score,
+        "breakdown": breakdown,
+        "feedback": pack_text(feedback),
         "timestamp": datetime.datetime.utcnow()
-    })
+    }
+    # MinHash signature over the preprocessed answer, for copy detection;
+    # optional, so a failure here must never fail grading
+    if clean_answer is not None:
+        try:
+            signature = minhash_signature(clean_answer)
+        except Exception:
+            logger.exception("MinHash signature failed")
+            signature = None
+        if signature is not None:
+            doc["minhash"] = signature
+    if attempt_id:
+        doc["attempt_id"] = attempt_id
+    return responses_col().insert_one(doc).inserted_id
 
-def store_result(email, test_id, total_score, per_question_scores):
-    results_col().insert_one({
+def store_result(email, test_id, total_score, per_question_scores, attempt_id=None):
+    # compact form: parallel arrays of references and numeric scores
+    doc = {
         "email": email,
         "test_id": test_id,
         "total_score": total_score,
-        "per_question_scores": per_question_scores,
+        "question_ids": [item["question_id"] for item in per_question_scores],
+        "response_ids": [item["response_id"] for item in per_question_scores],
+        "scores": [item["score"] for item in per_question_scores],
         "timestamp": datetime.datetime.utcnow()
-    })
+    }
+    if attempt_id:
+        doc["attempt_id"] = attempt_id
+    results_col().insert_one(doc)
+
+def get_responses_by_id(response_ids, fields=("student_answer", "score", "breakdown", "feedback")):
+    cursor = responses_col().find({"_id": {"$in": list(response_ids)}}, {f: 1 for f in fields})
+    responses = {}
+    for doc in cursor:
+        for f in ("student_answer", "feedback"):
+            if f in doc:
+                doc[f] = unpack_text(doc[f])
+        responses[doc["_id"]] = doc
+    return responses
+
+def hydrate_results(results):
+    """
+    Rebuilds `per_question_scores` (question text, answer, score, breakdown,
+    feedback) for compact results with one responses query for the batch.
+    Results still in the old inline format are returned unchanged.
+    """
+    compact = [r for r in results if "response_ids" in r]
+    responses = get_responses_by_id({rid for r in compact for rid in r["response_ids"]})
+    tests = {}
+    for r in compact:
+        if r["test_id"] not in tests:
+            tests[r["test_id"]] = get_test_by_id(r["test_id"]) or {}
+        question_text = {q["id"]: q.get("text", "") for q in tests[r["test_id"]].get("questions", [])}
+        r["per_question_scores"] = []
+        for qid, rid, score in zip(r["question_ids"], r["response_ids"], r["scores"]):
+            resp = responses.get(rid, {})
+            r["per_question_scores"].append({
+                "question_id": qid,
+                "question_text": question_text.get(qid, ""),
+                "student_answer": resp.get("student_answer", ""),
+                "score": score,
+                "breakdown": resp.get("breakdown"),
+                "feedback": resp.get("feedback", ""),
+            })
+    return results
+
+def get_user_results(email, hydrate=False):
+    results = list(results_col().find({"email": email}, {"_id": 0}))
+    return hydrate_results(results) if hydrate else results
 
-def get_user_results(email):
-    return list(results_col().find({"email": email}, {"_id": 0}))
+def ensure_indexes():
+    responses_col().create_index([("test_id", 1), ("question_id", 1)])
+    results_col().create_index([("test_id", 1)])
+    # per-student lookups: dashboard, result compaction
+    results_col().create_index([("email", 1), ("test_id", 1), ("timestamp", 1)])
+    responses_col().create_index([("email", 1), ("test_id", 1), ("question_id", 1), ("timestamp", 1)])
+    responses_col().create_index([("attempt_id", 1)], sparse=True)
+    results_col().create_index([("attempt_id", 1)], sparse=True)
+    drafts_col().create_index([("email", 1), ("test_id", 1)])
+    # abandoned drafts expire after a week
+    drafts_col().create_index([("updated_at", 1)], expireAfterSeconds=7 * 24 * 3600)
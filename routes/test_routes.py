@@ -1,5 +1,9 @@
-from flask import Blueprint, render_template, request, redirect, url_for, session, flash, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, session, flash, current_app, jsonify, Response, stream_with_context, abort
 import models
+from services.similarity import find_clusters
+from services.export import FORMATS, stream_export
+from services.drafts import drafts
+from services.scheduler import grading, QueueFull
 
 test_bp = Blueprint("test", __name__, url_prefix="/test")
 
@@ -17,16 +21,37 @@ def require_login():
 
 @test_bp.route("/start/<test_id>", methods=["GET"])
 def start(test_id):
-    # clear any previous answers in session and load first question
+    # resume this user's in-progress attempt, or start a fresh server-side
+    # one; the session only keeps its id
     test = models.get_test_by_id(test_id)
     if not test:
         flash("Test not found", "danger")
         return redirect(url_for("home"))
-    session[f"answers_{test_id}"] = {}
-    session[f"current_q_{test_id}"] = 0
+    email = session["user"]["email"]
+    attempt = _current_attempt(test_id) or models.find_attempt(email, test_id)
+    if attempt:
+        session[f"attempt_{test_id}"] = attempt["_id"]
+    else:
+        session[f"attempt_{test_id}"] = models.create_attempt(email, test_id)
     return redirect(url_for("test.question", test_id=test_id))
 
 
+def _require_admin():
+    # instructor-only views; there is no role model, so use an allow-list
+    if session["user"]["email"] not in current_app.config.get("ADMIN_EMAILS", set()):
+        abort(403)
+
+
+def _current_attempt(test_id):
+    attempt_id = session.get(f"attempt_{test_id}")
+    if not attempt_id:
+        return None
+    attempt = drafts.load(attempt_id)
+    if not attempt or attempt["email"] != session["user"]["email"] or attempt["test_id"] != test_id:
+        return None
+    return attempt
+
+
 @test_bp.route("/question/<test_id>", methods=["GET", "POST"])
 def question(test_id):
     test = models.get_test_by_id(test_id)
@@ -34,37 +59,60 @@ def question(test_id):
         flash("Test not found", "danger")
         return redirect(url_for("home"))
     questions = test.get("questions", [])
-    current_index = session.get(f"current_q_{test_id}", 0)
-    answers = session.get(f"answers_{test_id}", {})
+    attempt = _current_attempt(test_id)
+    if not attempt:
+        return redirect(url_for("test.start", test_id=test_id))
+    attempt_id = attempt["_id"]
+    current_index = attempt.get("current_q", 0)
+    answers = attempt.get("answers", {})
 
     if request.method == "POST":
         qid = request.form.get("qid")
         answer_text = request.form.get("answer", "").strip()
-        # save answer in session
-        answers[qid] = answer_text
-        session[f"answers_{test_id}"] = answers
-        # move next
-        current_index += 1
-        session[f"current_q_{test_id}"] = current_index
+        # only the current question can be answered; a stale or forged form
+        # just re-renders it
+        if current_index < len(questions) and qid == questions[current_index]["id"]:
+            # save only this answer and move next
+            answers[qid] = answer_text
+            current_index += 1
+            drafts.save(attempt_id, qid, answer_text, current_q=current_index)
 
     # If finished
     if current_index >= len(questions):
-        # All answers collected; run agent to evaluate and email
+        # All answers collected; queue the agent to evaluate and email
         user = session.get("user")
         if not user:
             flash("Please login to submit test", "danger")
             return redirect(url_for("auth.login"))
+        drafts.flush(attempt_id)
+        agent = current_app.feedback_agent
 
-        # Use LangGraph feedback agent instead of run_feedback_agent
-        result = current_app.feedback_agent.invoke({
-            "student_name": user["name"],
-            "student_email": user["email"],
-            "test_id": test_id,
-            "answers_map": answers,
-        })
+        def grade():
+            # Use LangGraph feedback agent instead of run_feedback_agent
+            try:
+                result = agent.invoke({
+                    "student_name": user["name"],
+                    "student_email": user["email"],
+                    "test_id": test_id,
+                    "attempt_id": attempt_id,
+                    "answers_map": answers,
+                })
+            except Exception:
+                # undo a partial run so resubmitting doesn't store duplicates
+                models.delete_attempt_submission(attempt_id)
+                raise
+            drafts.discard(attempt_id)
+            return result["overall"]
 
-        flash(f"Test submitted. Overall Score: {result['overall']}", "success")
-        return redirect(url_for("test.dashboard"))
+        try:
+            grading.submit(attempt_id, grade)
+        except QueueFull:
+            # back-pressure: answers stay saved, reloading this page resubmits
+            retry = current_app.config.get("GRADING_RETRY_AFTER", 30)
+            return render_template(
+                "grading_status.html", state="busy", test_id=test_id
+            ), 503, {"Retry-After": str(retry), "Refresh": f"{retry}; url={request.base_url}"}
+        return redirect(url_for("test.status", test_id=test_id))
 
     # render current question
     q = questions[current_index]
@@ -74,13 +122,82 @@ def question(test_id):
         index=current_index + 1,
         total=len(questions),
         test_id=test_id,
+        answer=answers.get(q["id"], ""),
     )
 
 
+@test_bp.route("/status/<test_id>")
+def status(test_id):
+    attempt_id = session.get(f"attempt_{test_id}")
+    job = grading.status(attempt_id) if attempt_id else None
+    if job is None:
+        # nothing queued in this process (e.g. after a restart): resubmit if
+        # the draft is still there, otherwise the result is already stored
+        if attempt_id and models.get_attempt(attempt_id):
+            return redirect(url_for("test.question", test_id=test_id))
+        return redirect(url_for("test.dashboard"))
+    if job["state"] == "done":
+        grading.forget(attempt_id)
+        session.pop(f"attempt_{test_id}", None)
+        flash(f"Test submitted. Overall Score: {job['result']}", "success")
+        return redirect(url_for("test.dashboard"))
+    if job["state"] == "failed":
+        # partial writes were rolled back and the draft kept, so the
+        # question page can queue it again
+        return render_template("grading_status.html", state="failed", test_id=test_id)
+    return render_template(
+        "grading_status.html", state=job["state"], position=job.get("position"), test_id=test_id
+    ), 200, {"Refresh": "3"}
+
+
+@test_bp.route("/autosave/<test_id>", methods=["POST"])
+def autosave(test_id):
+    attempt = _current_attempt(test_id)
+    if not attempt:
+        return jsonify({"saved": False}), 409
+    qid = request.form.get("qid")
+    test = models.get_test_by_id(test_id) or {}
+    if qid not in {q["id"] for q in test.get("questions", [])}:
+        return jsonify({"saved": False}), 400
+    drafts.autosave(attempt["_id"], qid, request.form.get("answer", "").strip())
+    return jsonify({"saved": True})
+
+
 @test_bp.route("/dashboard")
 def dashboard():
     user = session.get("user")
     if not user:
         return redirect(url_for("auth.login"))
-    results = models.get_user_results(user["email"])
+    results = models.get_user_results(user["email"], hydrate=True)
     return render_template("dashboard.html", results=results, user=user)
+
+
+@test_bp.route("/similarity/<test_id>/<question_id>")
+def similarity(test_id, question_id):
+    # candidate copy clusters for one question (MinHash + LSH)
+    _require_admin()
+    threshold = request.args.get("threshold", type=float)
+    clusters = find_clusters(test_id, question_id, threshold=threshold)
+    return jsonify({"test_id": test_id, "question_id": question_id, "clusters": clusters})
+
+
+@test_bp.route("/export/<test_id>")
+def export(test_id):
+    # stream results as csv / jsonl / parquet without loading the cohort in memory
+    _require_admin()
+    fmt = request.args.get("format", "csv")
+    include_text = request.args.get("text", "1") != "0"
+    if fmt not in FORMATS:
+        abort(400, f"Unsupported export format: {fmt}")
+    test = models.get_test_by_id(test_id)
+    if not test:
+        abort(404)
+    try:
+        chunks = stream_export(test, fmt, include_text)
+    except RuntimeError as e:
+        abort(501, str(e))
+    return Response(
+        stream_with_context(chunks),
+        mimetype=FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename={test_id}_results.{fmt}"},
+    )
@@ -0,0 +1,183 @@
+# services/compaction.py
+"""
+Migration from the inline result schema to the compact one.
+
+Old results embed question text, answer, breakdown and feedback in
+`per_question_scores`, duplicating what `responses` and `tests` already hold.
+The migration moves breakdown / feedback onto the matching response, packs
+answer and feedback text, drops `question_text` from responses and rewrites
+each result as parallel `question_ids` / `response_ids` / `scores` arrays.
+"""
+import logging
+
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+
+import models
+from services.similarity import backfill_signatures
+
+logger = logging.getLogger(__name__)
+
+
+def collection_stats(col):
+    """Document count, data size (working set) and on-disk size in bytes."""
+    stats = next(col.aggregate([{"$collStats": {"storageStats": {}}}]), {}).get("storageStats", {})
+    return {
+        "count": stats.get("count", 0),
+        "size": stats.get("size", 0),
+        "avg_obj_size": stats.get("avgObjSize", 0),
+        "storage_size": stats.get("storageSize", 0),
+    }
+
+
+def storage_report():
+    return {
+        "results": collection_stats(models.results_col()),
+        "responses": collection_stats(models.responses_col()),
+    }
+
+
+def _matching_responses(result):
+    """
+    Maps question id -> response id for the submission behind `result`,
+    with one query. A submission writes its responses after the student's
+    previous result for the test and before its own, so only that window is
+    searched; responses belonging to another result are never matched.
+    """
+    query = {
+        "email": result["email"],
+        "test_id": result["test_id"],
+        "question_id": {"$in": [item.get("question_id") for item in result.get("per_question_scores", [])]},
+    }
+    ts = result.get("timestamp")
+    if ts is not None:
+        query["timestamp"] = {"$lte": ts}
+        previous = models.results_col().find_one(
+            {"email": result["email"], "test_id": result["test_id"], "timestamp": {"$lt": ts}},
+            {"timestamp": 1},
+            sort=[("timestamp", -1)],
+        )
+        if previous:
+            query["timestamp"]["$gt"] = previous["timestamp"]
+    matches = {}
+    for doc in models.responses_col().find(query, {"question_id": 1}).sort("timestamp", -1):
+        matches.setdefault(doc["question_id"], doc["_id"])
+    return matches
+
+
+def migrate_result(result):
+    """
+    Builds the writes that rewrite one inline result. Returns
+    (response_ops, result_op); ids of re-created responses are assigned here
+    so both can go out in bulk.
+    """
+    question_ids, response_ids, scores = [], [], []
+    response_ops = []
+    matches = _matching_responses(result)
+    for item in result.get("per_question_scores", []):
+        answer = models.pack_text(item.get("student_answer"))
+        feedback = models.pack_text(item.get("feedback"))
+        rid = matches.get(item.get("question_id"))
+        if rid:
+            response_ops.append(UpdateOne(
+                {"_id": rid},
+                {
+                    "$set": {"student_answer": answer, "feedback": feedback, "breakdown": item.get("breakdown")},
+                    "$unset": {"question_text": ""},
+                },
+            ))
+        else:
+            rid = ObjectId()
+            response_ops.append(InsertOne({
+                "_id": rid,
+                "email": result["email"],
+                "test_id": result["test_id"],
+                "question_id": item.get("question_id"),
+                "student_answer": answer,
+                "score": item.get("score"),
+                "breakdown": item.get("breakdown"),
+                "feedback": feedback,
+                "timestamp": result.get("timestamp"),
+            }))
+        question_ids.append(item.get("question_id"))
+        response_ids.append(rid)
+        scores.append(item.get("score"))
+
+    result_op = UpdateOne(
+        {"_id": result["_id"]},
+        {
+            "$set": {"question_ids": question_ids, "response_ids": response_ids, "scores": scores},
+            "$unset": {"per_question_scores": ""},
+        },
+    )
+    return response_ops, result_op
+
+
+def _write_batch(response_ops, result_ops):
+    """Returns the number of responses inserted."""
+    inserted = 0
+    # responses first, so a result never references a missing response
+    if response_ops:
+        inserted = models.responses_col().bulk_write(response_ops, ordered=False).inserted_count
+    if result_ops:
+        models.results_col().bulk_write(result_ops, ordered=False)
+    return inserted
+
+
+def compact_responses(batch_size=500):
+    """Packs remaining plain-text answers and drops duplicated question text."""
+    unset = models.responses_col().update_many(
+        {"question_text": {"$exists": True}}, {"$unset": {"question_text": ""}}
+    ).modified_count
+
+    packed = 0
+    ops = []
+    cursor = models.responses_col().find(
+        {"student_answer": {"$type": "string"}}, {"student_answer": 1}
+    ).batch_size(batch_size)
+    for doc in cursor:
+        value = models.pack_text(doc["student_answer"])
+        if isinstance(value, bytes):
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"student_answer": value}}))
+        if len(ops) >= batch_size:
+            packed += models.responses_col().bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        packed += models.responses_col().bulk_write(ops, ordered=False).modified_count
+    return unset, packed
+
+
+def migrate(batch_size=500):
+    """Runs the full migration; returns counters and before/after storage stats."""
+    models.ensure_indexes()
+    before = storage_report()
+
+    migrated = inserted = 0
+    response_ops, result_ops = [], []
+    cursor = models.results_col().find(
+        {"per_question_scores": {"$exists": True}}
+    ).batch_size(batch_size)
+    for result in cursor:
+        ops, result_op = migrate_result(result)
+        response_ops += ops
+        result_ops.append(result_op)
+        migrated += 1
+        if len(result_ops) >= batch_size:
+            inserted += _write_batch(response_ops, result_ops)
+            response_ops, result_ops = [], []
+    inserted += _write_batch(response_ops, result_ops)
+    unset, packed = compact_responses(batch_size)
+    # re-created responses need MinHash signatures for copy detection
+    signed = backfill_signatures(batch_size=batch_size)
+
+    after = storage_report()
+    logger.info(f"Compacted {migrated} results ({inserted} responses recreated, {packed} answers packed)")
+    return {
+        "results_migrated": migrated,
+        "responses_inserted": inserted,
+        "question_text_removed": unset,
+        "answers_packed": packed,
+        "signatures_added": signed,
+        "before": before,
+        "after": after,
+    }
@@ -0,0 +1,128 @@
+# services/drafts.py
+"""
+Server-side answer drafts.
+
+Answers live in the `drafts` collection keyed by an attempt id, so the session
+cookie only has to carry that id. Explicit "Submit & Next" saves are written
+through immediately; autosaves are coalesced in an in-process write-behind
+buffer and flushed in bulk every DRAFT_FLUSH_INTERVAL seconds.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+
+import models
+
+logger = logging.getLogger(__name__)
+
+
+class DraftStore:
+    def __init__(self):
+        self.app = None
+        self.flush_interval = 2.0
+        self._pending = {}
+        self._lock = threading.Lock()
+        # serializes DB writes so a buffered autosave can never land after
+        # a newer write-through save of the same answer
+        self._write_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.flush_interval = app.config.get("DRAFT_FLUSH_INTERVAL", 2.0)
+        atexit.register(self._flush_at_exit)
+
+    # ----------------------
+    # Writes
+    # ----------------------
+    def autosave(self, attempt_id, question_id, answer):
+        """Buffer an answer; only the latest value per question is written."""
+        with self._lock:
+            self._pending.setdefault(attempt_id, {})[question_id] = answer
+        self._ensure_flusher()
+
+    def save(self, attempt_id, question_id, answer, current_q=None):
+        """Write one answer (and optionally the position) through to Mongo."""
+        with self._write_lock:
+            with self._lock:
+                buffered = self._pending.get(attempt_id)
+                if buffered:
+                    buffered.pop(question_id, None)
+            models.save_draft(attempt_id, {question_id: answer}, current_q)
+
+    def flush(self, attempt_id=None):
+        """Write buffered autosaves, for one attempt or all of them."""
+        with self._write_lock:
+            with self._lock:
+                if attempt_id is None:
+                    pending, self._pending = self._pending, {}
+                else:
+                    answers = self._pending.pop(attempt_id, None)
+                    pending = {attempt_id: answers} if answers else {}
+            pending = {k: v for k, v in pending.items() if v}
+            if not pending:
+                return
+            try:
+                models.save_drafts(pending)
+            except Exception:
+                # put the answers back unless a newer autosave replaced them
+                with self._lock:
+                    for aid, answers in pending.items():
+                        buffered = self._pending.setdefault(aid, {})
+                        for qid, text in answers.items():
+                            buffered.setdefault(qid, text)
+                raise
+
+    # ----------------------
+    # Reads
+    # ----------------------
+    def load(self, attempt_id):
+        """Attempt document with any not-yet-flushed answers merged in."""
+        attempt = models.get_attempt(attempt_id)
+        if attempt:
+            with self._lock:
+                attempt["answers"].update(self._pending.get(attempt_id, {}))
+        return attempt
+
+    def discard(self, attempt_id):
+        with self._lock:
+            self._pending.pop(attempt_id, None)
+        models.delete_attempt(attempt_id)
+
+    # ----------------------
+    # Background flusher
+    # ----------------------
+    def _ensure_flusher(self):
+        # started lazily so each (forked) worker process gets its own thread
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name="draft-flusher", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                with self.app.app_context():
+                    self.flush()
+            except Exception:
+                logger.exception("Draft flush failed")
+
+    def _flush_at_exit(self):
+        if self.app is None or not self._pending:
+            return
+        try:
+            with self.app.app_context():
+                self.flush()
+        except Exception:
+            logger.exception("Draft flush at exit failed")
+
+
+drafts = DraftStore()
@@ -45,15 +45,17 @@ def contains_negation(text: str):
 # -------------------------------
 def evaluate_answer(student_ans: str, teacher_ans: str):
     """
-    Returns score (0-100), and a dict breakdown.
+    Returns score (0-100), a dict breakdown and the preprocessed student
+    answer (None if it is empty or preprocessing failed).
     Uses Hugging Face REST API for SBERT similarity and
     Cross-Encoder locally.
     """
     student = (student_ans or "").strip()
     teacher = (teacher_ans or "").strip()
     if not student:
-        return 0.0, {"reason": "Empty answer"}
+        return 0.0, {"reason": "Empty answer"}, None
 
+    student_clean = None
     try:
         student_clean = preprocess_text(student)
         teacher_clean = preprocess_text(teacher)
@@ -117,8 +119,8 @@ def evaluate_answer(student_ans: str, teacher_ans: str):
             "final_pct": final_pct
         }
 
-        return final_pct, breakdown
+        return final_pct, breakdown, student_clean
 
     except Exception as e:
         logger.exception("Evaluation failed")
-        return 0.0, {"error": str(e)}
+        return 0.0, {"error": str(e)}, student_clean
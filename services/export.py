@@ -0,0 +1,244 @@
+# services/export.py
+"""
+Streaming export of one test's results as CSV, JSON Lines or Parquet.
+
+Results are read from a batched cursor with a field projection and flattened
+to one row per submission with per-question columns, so memory stays bounded
+by the batch size rather than by the size of the cohort.
+"""
+import csv
+import io
+import json
+import logging
+
+import models
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+BATCH_SIZE = 500
+# rows buffered before a chunk is handed to the client / file
+CHUNK_ROWS = 200
+
+
+# -------------------------------
+# Rows
+# -------------------------------
+def export_columns(test, include_text=True):
+    columns = ["email", "total_score", "timestamp"]
+    for q in test.get("questions", []):
+        columns.append(f"{q['id']}_score")
+        if include_text:
+            columns += [f"{q['id']}_answer", f"{q['id']}_feedback"]
+    return columns
+
+
+def _flatten(doc, responses, include_text):
+    row = {
+        "email": doc.get("email"),
+        "total_score": doc.get("total_score"),
+        "timestamp": doc.get("timestamp"),
+    }
+    if "response_ids" in doc:
+        for qid, rid, score in zip(doc["question_ids"], doc["response_ids"], doc["scores"]):
+            row[f"{qid}_score"] = score
+            if include_text:
+                resp = responses.get(rid, {})
+                row[f"{qid}_answer"] = resp.get("student_answer")
+                row[f"{qid}_feedback"] = resp.get("feedback")
+        return row
+    # results not yet migrated to the compact schema
+    for item in doc.get("per_question_scores", []):
+        qid = item.get("question_id")
+        row[f"{qid}_score"] = item.get("score")
+        if include_text:
+            row[f"{qid}_answer"] = item.get("student_answer")
+            row[f"{qid}_feedback"] = item.get("feedback")
+    return row
+
+
+def iter_rows(test_id, include_text=True, batch_size=BATCH_SIZE):
+    """
+    Yields one flat dict per stored result for the test. With text, answers
+    and feedback are fetched from `responses` with one query per batch.
+    """
+    projection = {
+        "_id": 0,
+        "email": 1,
+        "total_score": 1,
+        "timestamp": 1,
+        "question_ids": 1,
+        "response_ids": 1,
+        "scores": 1,
+        "per_question_scores.question_id": 1,
+        "per_question_scores.score": 1,
+    }
+    if include_text:
+        projection["per_question_scores.student_answer"] = 1
+        projection["per_question_scores.feedback"] = 1
+
+    cursor = models.results_col().find({"test_id": test_id}, projection, batch_size=batch_size)
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield from _flatten_batch(batch, include_text)
+            batch = []
+    if batch:
+        yield from _flatten_batch(batch, include_text)
+
+
+def _flatten_batch(batch, include_text):
+    responses = {}
+    if include_text:
+        ids = {rid for doc in batch for rid in doc.get("response_ids", [])}
+        if ids:
+            responses = models.get_responses_by_id(ids, fields=("student_answer", "feedback"))
+    for doc in batch:
+        yield _flatten(doc, responses, include_text)
+
+
+# -------------------------------
+# Writers (all yield bytes)
+# -------------------------------
+def _stream_csv(columns, rows):
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    for n, row in enumerate(rows, 1):
+        if row.get("timestamp") is not None:
+            row["timestamp"] = row["timestamp"].isoformat()
+        writer.writerow(row)
+        if n % CHUNK_ROWS == 0:
+            yield buf.getvalue().encode("utf-8")
+            buf.seek(0)
+            buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def _json_default(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def _stream_jsonl(columns, rows):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps({c: row.get(c) for c in columns}, default=_json_default))
+        if len(lines) >= CHUNK_ROWS:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+            lines = []
+    if lines:
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back in chunks."""
+
+    def __init__(self):
+        self.chunks = []
+        self.pos = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        out = b"".join(self.chunks)
+        self.chunks = []
+        return out
+
+
+def _parquet_schema(pa, columns):
+    fields = []
+    for c in columns:
+        if c == "timestamp":
+            fields.append(pa.field(c, pa.timestamp("us")))
+        elif c == "total_score" or c.endswith("_score"):
+            fields.append(pa.field(c, pa.float64()))
+        else:
+            fields.append(pa.field(c, pa.string()))
+    return pa.schema(fields)
+
+
+def _stream_parquet(columns, rows):
+    # optional dependency; checked before the first chunk is requested so a
+    # missing package fails the request instead of a half-sent response
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires the 'pyarrow' package")
+    return _parquet_chunks(pa, pq, columns, rows)
+
+
+def _parquet_chunks(pa, pq, columns, rows):
+    schema = _parquet_schema(pa, columns)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    def write_batch(batch):
+        table = pa.Table.from_pylist(batch, schema=schema)
+        writer.write_table(table)
+
+    batch = []
+    for row in rows:
+        batch.append({c: row.get(c) for c in columns})
+        # one row group per batch keeps the writer's buffer bounded
+        if len(batch) >= BATCH_SIZE:
+            write_batch(batch)
+            batch = []
+            yield sink.drain()
+    if batch:
+        write_batch(batch)
+    writer.close()
+    yield sink.drain()
+
+
+_WRITERS = {
+    "csv": _stream_csv,
+    "jsonl": _stream_jsonl,
+    "parquet": _stream_parquet,
+}
+
+
+# -------------------------------
+# Entry points
+# -------------------------------
+def stream_export(test, fmt="csv", include_text=True):
+    """Returns a generator of encoded chunks for the test's results."""
+    if fmt not in _WRITERS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    columns = export_columns(test, include_text)
+    rows = iter_rows(test["id"], include_text)
+    return _WRITERS[fmt](columns, rows)
+
+
+def export_to_file(test, path, fmt="csv", include_text=True):
+    """Streams the export straight to `path`; returns the bytes written."""
+    chunks = stream_export(test, fmt, include_text)
+    written = 0
+    with open(path, "wb") as fh:
+        for chunk in chunks:
+            fh.write(chunk)
+            written += len(chunk)
+    logger.info(f"Exported results for {test['id']} to {path} ({written} bytes)")
+    return written
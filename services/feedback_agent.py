@@ -16,6 +16,7 @@ class AgentState(dict):
     student_name: str
     student_email: str
     test_id: str
+    attempt_id: str
     answers_map: Dict[str, str]
     per_question_scores: List[Dict[str, Any]]
     overall: float
@@ -61,19 +62,27 @@ def evaluate_answers(state: AgentState) -> AgentState:
         student_ans = answers_map.get(qid, "")
 
         # Step 1: Rule-based or ML evaluation
-        score, breakdown = evaluate_answer(student_ans, ideal)
+        score, breakdown, student_clean = evaluate_answer(student_ans, ideal)
 
-        # Step 2: Store raw response
-        models.store_response(student_email, test_id, qid, qtext, student_ans, score)
-
-        # Step 3: Generate AI feedback via LLaMA (Ensure services/huggingface_api.py is FIXED!)
+        # Step 2: Generate AI feedback via LLaMA (Ensure services/huggingface_api.py is FIXED!)
         feedback_text = generate_feedback(qtext, student_ans, score)
+
+        # Step 3: Store the response once, with its breakdown and feedback
+        # (and MinHash signature for copy detection); results only reference it
+        response_id = models.store_response(
+            student_email, test_id, qid, student_ans, score,
+            clean_answer=student_clean,
+            breakdown=breakdown,
+            feedback=feedback_text,
+            attempt_id=state.get("attempt_id"),
+        )
         
         # Prepare feedback for HTML (replace newlines with <br/>)
         html_feedback = feedback_text.replace('\n', '<br/>')
 
         per_question_scores.append({
             "question_id": qid,
+            "response_id": response_id,
             "question_text": qtext,
             "student_answer": student_ans,
             "score": score,
@@ -107,7 +116,7 @@ def evaluate_answers(state: AgentState) -> AgentState:
 
     # Compute overall
     overall = round(total / max(1, len(questions)), 2)
-    models.store_result(student_email, test_id, overall, per_question_scores)
+    models.store_result(student_email, test_id, overall, per_question_scores, attempt_id=state.get("attempt_id"))
 
     # Save results in state
     state["per_question_scores"] = per_question_scores
@@ -0,0 +1,222 @@
+# services/scheduler.py
+"""
+Admission control for grading work.
+
+Grading (model inference + LLM calls) runs on a small pool of background
+threads instead of inside the request, so gunicorn workers stay free for
+interactive page loads:
+
+- at most GRADING_MAX_JOBS jobs run at once, each limited to
+  GRADING_TORCH_THREADS torch intra-op threads;
+- a job waits (up to GRADING_INTERACTIVE_WAIT seconds) for in-flight
+  interactive requests to finish before it starts, and grading threads run
+  at a lower OS priority;
+- when GRADING_MAX_QUEUE jobs are already waiting, new submissions are
+  rejected with QueueFull so the caller can ask the student to retry.
+"""
+import collections
+import logging
+import os
+import threading
+import time
+
+from flask import g, request
+
+logger = logging.getLogger(__name__)
+
+# niceness added to grading threads (Linux applies it per thread)
+GRADING_NICE = 10
+# finished jobs kept around so students can still read their status
+MAX_FINISHED = 1000
+
+
+class QueueFull(Exception):
+    pass
+
+
+class GradingScheduler:
+    def __init__(self):
+        self.app = None
+        self.max_jobs = 2
+        self.max_queue = 100
+        self.torch_threads = 1
+        self.interactive_wait = 2.0
+
+        self._cond = threading.Condition()
+        self._queue = collections.deque()
+        self._jobs = collections.OrderedDict()
+        self._running = 0
+        self._interactive = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._waits = collections.deque(maxlen=200)
+        self._workers = []
+        self._pid = None
+
+    def init_app(self, app):
+        self.app = app
+        self.max_jobs = max(1, app.config.get("GRADING_MAX_JOBS", 2))
+        self.max_queue = app.config.get("GRADING_MAX_QUEUE", 100)
+        self.interactive_wait = app.config.get("GRADING_INTERACTIVE_WAIT", 2.0)
+        # by default leave one core for serving pages and split the rest
+        self.torch_threads = app.config.get("GRADING_TORCH_THREADS") or max(
+            1, ((os.cpu_count() or 1) - 1) // self.max_jobs
+        )
+        app.before_request(self._interactive_start)
+        app.teardown_request(self._interactive_end)
+
+    # ----------------------
+    # Interactive request tracking
+    # ----------------------
+    def _interactive_start(self):
+        if request.endpoint == "static":
+            return
+        g._interactive = True
+        with self._cond:
+            self._interactive += 1
+
+    def _interactive_end(self, exc=None):
+        if not g.pop("_interactive", False):
+            return
+        with self._cond:
+            self._interactive -= 1
+            if self._interactive == 0:
+                self._cond.notify_all()
+
+    # ----------------------
+    # Jobs
+    # ----------------------
+    def submit(self, job_id, fn):
+        """
+        Queue `fn` under `job_id` and return its status. Submitting an id
+        that is already queued or running returns the existing status.
+        Raises QueueFull when the backlog is at GRADING_MAX_QUEUE.
+        """
+        self._ensure_workers()
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job and job["state"] in ("queued", "running"):
+                return self._status(job)
+            if len(self._queue) >= self.max_queue:
+                self._rejected += 1
+                raise QueueFull()
+            job = {
+                "id": job_id,
+                "fn": fn,
+                "state": "queued",
+                "result": None,
+                "enqueued_at": time.monotonic(),
+            }
+            self._jobs[job_id] = job
+            self._jobs.move_to_end(job_id)
+            self._queue.append(job)
+            self._prune()
+            self._cond.notify_all()
+            return self._status(job)
+
+    def status(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return self._status(job) if job else None
+
+    def forget(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job and job["state"] in ("done", "failed"):
+                del self._jobs[job_id]
+
+    def _status(self, job):
+        status = {"state": job["state"], "result": job["result"]}
+        if job["state"] == "queued":
+            status["position"] = self._queue.index(job) + 1
+        return status
+
+    def _prune(self):
+        finished = [k for k, j in self._jobs.items() if j["state"] in ("done", "failed")]
+        for k in finished[:max(0, len(finished) - MAX_FINISHED)]:
+            del self._jobs[k]
+
+    def metrics(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            return {
+                "queue_depth": len(self._queue),
+                "running": self._running,
+                "interactive_in_flight": self._interactive,
+                "max_jobs": self.max_jobs,
+                "max_queue": self.max_queue,
+                "torch_threads_per_job": self.torch_threads,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "wait_seconds_avg": round(sum(waits) / len(waits), 3) if waits else 0.0,
+                "wait_seconds_p95": round(waits[int(0.95 * (len(waits) - 1))], 3) if waits else 0.0,
+                "wait_seconds_max": round(waits[-1], 3) if waits else 0.0,
+            }
+
+    # ----------------------
+    # Workers
+    # ----------------------
+    def _ensure_workers(self):
+        # started lazily so each (forked) worker process gets its own pool
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._workers = []
+            for i in range(self.max_jobs):
+                t = threading.Thread(target=self._run, name=f"grading-{i}", daemon=True)
+                t.start()
+                self._workers.append(t)
+
+    def _limit_thread(self):
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), GRADING_NICE)
+        except (AttributeError, OSError):
+            logger.debug("Could not lower grading thread priority")
+        try:
+            import torch
+            torch.set_num_threads(self.torch_threads)
+        except ImportError:
+            pass
+
+    def _next_job(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+            # let interactive requests finish first, but never starve grading
+            deadline = time.monotonic() + self.interactive_wait
+            while self._interactive > 0 and time.monotonic() < deadline:
+                self._cond.wait(timeout=max(0.0, deadline - time.monotonic()))
+            if not self._queue:
+                return None
+            job = self._queue.popleft()
+            job["state"] = "running"
+            self._running += 1
+            self._waits.append(time.monotonic() - job["enqueued_at"])
+            return job
+
+    def _run(self):
+        self._limit_thread()
+        while True:
+            job = self._next_job()
+            if job is None:
+                continue
+            try:
+                with self.app.app_context():
+                    result = job["fn"]()
+                state = "done"
+            except Exception:
+                logger.exception(f"Grading job {job['id']} failed")
+                result, state = None, "failed"
+            with self._cond:
+                job["state"], job["result"], job["fn"] = state, result, None
+                self._running -= 1
+                if state == "done":
+                    self._completed += 1
+                else:
+                    self._failed += 1
+
+
+grading = GradingScheduler()
@@ -0,0 +1,189 @@
+# services/similarity.py
+"""
+Near-duplicate detection for student answers using MinHash + LSH.
+
+Signatures are computed once per response (from the preprocessed answer text)
+and stored on the response document as a compact uint32 byte string, so the
+LSH index for a (test_id, question_id) pair can be rebuilt at any time by
+streaming the `responses` collection.
+"""
+import logging
+import zlib
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+NUM_PERM = config.SIMILARITY_NUM_PERM
+BANDS = config.SIMILARITY_BANDS
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 3
+
+# Fixed seed so signatures stay comparable across processes and restarts
+_rng = np.random.RandomState(1)
+_PERM_A = _rng.randint(0, 2**64, size=NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_PERM_B = _rng.randint(0, 2**64, size=NUM_PERM, dtype=np.uint64)
+
+
+# -------------------------------
+# Signatures
+# -------------------------------
+def shingles(clean_text: str):
+    """Word n-gram shingles; short answers fall back to single words."""
+    words = (clean_text or "").split()
+    if len(words) < SHINGLE_SIZE:
+        return set(words)
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def minhash_signature(clean_text: str):
+    """
+    Returns the MinHash signature as `NUM_PERM * 4` bytes, or None when the
+    text has no shingles (e.g. empty answers).
+    """
+    grams = shingles(clean_text)
+    if not grams:
+        return None
+    hashes = np.fromiter(
+        (zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams)
+    )
+    # multiply-shift hashing: (a * x + b) mod 2^64, keep the high 32 bits
+    permuted = (np.outer(hashes, _PERM_A) + _PERM_B) >> np.uint64(32)
+    return permuted.min(axis=0).astype(np.uint32).tobytes()
+
+
+def signature_similarity(sig_a: bytes, sig_b: bytes):
+    """Estimated Jaccard similarity of two stored signatures."""
+    a = np.frombuffer(sig_a, dtype=np.uint32)
+    b = np.frombuffer(sig_b, dtype=np.uint32)
+    return float(np.count_nonzero(a == b)) / NUM_PERM
+
+
+# -------------------------------
+# LSH index
+# -------------------------------
+class LSHIndex:
+    """In-memory banded LSH index over MinHash signatures."""
+
+    def __init__(self):
+        self.keys = []
+        self.signatures = []
+        self.buckets = {}
+
+    def add(self, key, signature: bytes):
+        pos = len(self.keys)
+        self.keys.append(key)
+        self.signatures.append(np.frombuffer(signature, dtype=np.uint32))
+        bands = self.signatures[pos].reshape(BANDS, ROWS)
+        for band_idx in range(BANDS):
+            self.buckets.setdefault((band_idx, bands[band_idx].tobytes()), []).append(pos)
+
+    def _similarity(self, i, j):
+        return float(np.count_nonzero(self.signatures[i] == self.signatures[j])) / NUM_PERM
+
+    def clusters(self, threshold):
+        """
+        Groups indexed keys whose estimated similarity is >= threshold.
+        Only members sharing at least one LSH bucket are ever compared, and
+        within a bucket each member is checked against one representative
+        per group, so identical-answer pile-ups stay linear.
+        """
+        parent = list(range(len(self.keys)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        for members in self.buckets.values():
+            if len(members) < 2:
+                continue
+            reps = []
+            for m in members:
+                for r in reps:
+                    if self._similarity(r, m) >= threshold:
+                        parent[find(m)] = find(r)
+                        break
+                else:
+                    reps.append(m)
+
+        groups = {}
+        for i in range(len(self.keys)):
+            groups.setdefault(find(i), []).append(self.keys[i])
+        return [g for g in groups.values() if len(g) > 1]
+
+
+# -------------------------------
+# Collection helpers
+# -------------------------------
+def build_index(test_id, question_id, batch_size=1000):
+    """Streams stored signatures for one question into an LSHIndex."""
+    import models
+
+    index = LSHIndex()
+    cursor = models.responses_col().find(
+        {"test_id": test_id, "question_id": question_id, "minhash": {"$exists": True}},
+        {"email": 1, "minhash": 1},
+    ).batch_size(batch_size)
+    for doc in cursor:
+        index.add((str(doc["_id"]), doc["email"]), bytes(doc["minhash"]))
+    return index
+
+
+def find_clusters(test_id, question_id, threshold=None):
+    """
+    Returns candidate copy clusters for one question, largest first.
+    Clusters made up of a single student's own attempts are dropped.
+    """
+    threshold = config.SIMILARITY_THRESHOLD if threshold is None else threshold
+    index = build_index(test_id, question_id)
+    clusters = []
+    for group in index.clusters(threshold):
+        emails = sorted({email for _, email in group})
+        if len(emails) < 2:
+            continue
+        clusters.append({
+            "size": len(group),
+            "emails": emails,
+            "response_ids": [rid for rid, _ in group],
+        })
+    clusters.sort(key=lambda c: c["size"], reverse=True)
+    return clusters
+
+
+def backfill_signatures(test_id=None, batch_size=500):
+    """
+    Computes signatures for stored responses that don't have one yet.
+    Returns the number of responses updated.
+    """
+    import models
+    from pymongo import UpdateOne
+    # heavy import (loads NLTK data and the cross-encoder); only needed here
+    from services.evaluation import preprocess_text
+
+    query = {"minhash": {"$exists": False}}
+    if test_id:
+        query["test_id"] = test_id
+    cursor = models.responses_col().find(query, {"student_answer": 1}).batch_size(batch_size)
+
+    updated = 0
+    ops = []
+    for doc in cursor:
+        try:
+            signature = minhash_signature(preprocess_text(models.unpack_text(doc.get("student_answer")) or ""))
+        except Exception:
+            logger.exception(f"MinHash signature failed for response {doc['_id']}")
+            continue
+        if signature is None:
+            continue
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"minhash": signature}}))
+        if len(ops) >= batch_size:
+            updated += models.responses_col().bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += models.responses_col().bulk_write(ops, ordered=False).modified_count
+    logger.info(f"Backfilled {updated} MinHash signatures")
+    return updated